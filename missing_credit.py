@@ -8,11 +8,20 @@ Original file is located at
 """
 
 
+import numpy as np
 import pandas as pd
-import os
-import re
 from tkinter import Tk, filedialog
 
+# Columns the final report is built from; restricting the parse to these skips
+# type inference and string allocation for everything else.
+FINAL_COLUMNS = ['ACCOUNT', 'PO #', 'DESCRIPTION', 'CREDIT AMT', 'DRUG LETTER', 'DRUG NAME', 'QUARTER KEY']
+
+def load_csv(file_path):
+    header = pd.read_csv(file_path, nrows=0).columns
+    usecols = [c for c in FINAL_COLUMNS if c in header]
+    # pyarrow engine: multi-threaded parse, Arrow-backed strings
+    return pd.read_csv(file_path, usecols=usecols or None, engine='pyarrow')
+
 def pick_file(title):
     root = Tk()
     root.withdraw()  # Hide the main window
@@ -23,45 +32,43 @@ def pick_file(title):
         exit(1)
     return file_path
 
-def extract_quarter_year(po):
-    # Example PO #: Q323 ONMK Akynzeo Rbt 8%
-    match = re.match(r'Q(\d)(\d{2})', str(po).strip())
-    if match:
-        quarter = int(match.group(1))
-        year = int('20' + match.group(2))  # e.g., '23' -> 2023
-        return quarter, year
-    return None, None
-
 print("This tool will compare two CSV files and report rows present in the second (comparer) but missing in the first (base), using only columns common to both.\n")
 
 base_file = pick_file("Select the BASE CSV file (the one to check for missing data)")
 comparer_file = pick_file("Select the COMPARER CSV file (the one to compare against)")
 
 # Load CSVs
-df_base = pd.read_csv(base_file)
-df_comparer = pd.read_csv(comparer_file)
+df_base = load_csv(base_file)
+df_comparer = load_csv(comparer_file)
 
 # Use 'DRUG NAME' if present, else try to extract from 'DESCRIPTION' or 'PO #' (fallback)
-def get_drug_name(row):
-    if 'DRUG NAME' in row and pd.notna(row['DRUG NAME']):
-        return str(row['DRUG NAME']).strip()
-    if 'DESCRIPTION' in row and pd.notna(row['DESCRIPTION']):
+def get_drug_names(df):
+    if 'DRUG NAME' in df.columns:
+        names = df['DRUG NAME'].fillna('').astype(str).str.strip()
+    else:
+        names = pd.Series('', index=df.index)
+    # Run each fallback regex only over the rows still unresolved; when the
+    # DRUG NAME fill-rate is high that is a small fraction of the frame
+    need = names.eq('')
+    if 'DESCRIPTION' in df.columns and need.any():
         # Try to extract a word after 'Credit memo :' or similar
-        m = re.search(r'Credit memo\s*:\s*([^\-]+)', str(row['DESCRIPTION']))
-        if m:
-            return m.group(1).strip()
-    if 'PO #' in row and pd.notna(row['PO #']):
+        names.loc[need] = df.loc[need, 'DESCRIPTION'].astype(str).str.extract(r'Credit memo\s*:\s*([^\-]+)', expand=False).str.strip()
+        need = names.isna() | names.eq('')
+    if 'PO #' in df.columns and need.any():
         # Try to extract after quarter code
-        m = re.match(r'Q\d{3,4}\s*(.*)', str(row['PO #']))
-        if m:
-            return m.group(1).strip()
-    return ''
+        names.loc[need] = df.loc[need, 'PO #'].astype(str).str.extract(r'^Q\d{3,4}\s*(.*)', expand=False).str.strip()
+    return names.fillna('')
 
 for df in [df_base, df_comparer]:
-    if 'DRUG NAME' not in df.columns:
-        df['DRUG NAME'] = df.apply(get_drug_name, axis=1)
-    else:
-        df['DRUG NAME'] = df['DRUG NAME'].fillna('').astype(str).str.strip()
+    df['DRUG NAME'] = get_drug_names(df)
+
+# Low-cardinality column: category dtype sorts/compares int codes instead of Python strings.
+# Share one category set so comparisons between the two frames stay on codes.
+# Sort the union explicitly: Index.union skips sorting when one side contains
+# the other, and category order is what sort_values sorts by.
+_drug_union = pd.Index(df_base['DRUG NAME'].unique()).union(df_comparer['DRUG NAME'].unique()).sort_values()
+for df in [df_base, df_comparer]:
+    df['DRUG NAME'] = pd.Categorical(df['DRUG NAME'], categories=_drug_union)
 
 # Use QUARTER KEY if present in both, else extract quarter/year from PO #
 use_quarter_key = 'QUARTER KEY' in df_base.columns and 'QUARTER KEY' in df_comparer.columns
@@ -69,20 +76,18 @@ use_quarter_key = 'QUARTER KEY' in df_base.columns and 'QUARTER KEY' in df_compa
 if use_quarter_key:
     print("Using 'DRUG NAME' and 'QUARTER KEY' for sorting and comparison.")
     sort_cols = ['DRUG NAME', 'QUARTER KEY']
-    df_base_sorted = df_base.sort_values(sort_cols, ascending=[True, True]).reset_index(drop=True)
-    df_comparer_sorted = df_comparer.sort_values(sort_cols, ascending=[True, True]).reset_index(drop=True)
 else:
     print("'QUARTER KEY' not found in both files. Falling back to extracting quarter/year from 'PO #'.")
     for df in [df_base, df_comparer]:
-        quarters, years = zip(*df['PO #'].map(extract_quarter_year))
-        df['Quarter'] = quarters
-        df['Year'] = years
+        # Example PO #: Q323 ONMK Akynzeo Rbt 8%
+        qy = df['PO #'].astype(str).str.strip().str.extract(r'^Q(\d)(\d{2})')
+        df['Quarter'] = pd.to_numeric(qy[0], errors='coerce').astype('Int8')
+        df['Year'] = (2000 + pd.to_numeric(qy[1], errors='coerce')).astype('Int16')  # e.g., '23' -> 2023
     sort_cols = ['DRUG NAME', 'Year', 'Quarter']
-    df_base_sorted = df_base.sort_values(sort_cols, ascending=[True, True, True]).reset_index(drop=True)
-    df_comparer_sorted = df_comparer.sort_values(sort_cols, ascending=[True, True, True]).reset_index(drop=True)
 
-# Find common columns
-common_cols = list(set(df_base_sorted.columns) & set(df_comparer_sorted.columns))
+# Find common columns, keeping the base file's stable column order
+# (a plain set intersection reorders arbitrarily from run to run)
+common_cols = [c for c in df_base.columns if c in set(df_comparer.columns)]
 if not common_cols:
     print("No common columns found between the two files. Cannot compare.")
     exit(1)
@@ -92,22 +97,31 @@ for col in common_cols:
     print("  - {}".format(col))
 
 # Compare: find rows in comparer not in base (on common columns)
-base_subset = df_base_sorted[common_cols].drop_duplicates()
-comparer_subset = df_comparer_sorted[common_cols].drop_duplicates()
-
-missing_rows = comparer_subset.merge(base_subset, on=common_cols, how='left', indicator=True)
-missing_rows = missing_rows[missing_rows['_merge'] == 'left_only']
-missing_rows = missing_rows.drop(columns=['_merge'])
-
-# Merge with original comparer to get all columns, then reindex to match base/comparer columns
-full_missing = df_comparer_sorted.merge(missing_rows, on=common_cols, how='inner')
-# Define the desired column order
-final_columns = ['ACCOUNT', 'PO #', 'DESCRIPTION', 'CREDIT AMT', 'DRUG LETTER', 'DRUG NAME', 'QUARTER KEY']
-# Add any missing columns as blank
-for col in final_columns:
-    if col not in full_missing.columns:
-        full_missing[col] = ''
-full_missing = full_missing[final_columns]
+# Hash each row of the key columns to a uint64, then take the set difference on
+# flat integer arrays -- one linear pass, no join machinery or tuple boxing.
+# Hash both frames through one concat so their columns are coerced to common
+# dtypes first; hashing them separately would give int64 10 and float64 10.0
+# different hashes whenever type inference differs between the two CSVs.
+base_subset = df_base[common_cols].drop_duplicates()
+combined_keys = pd.util.hash_pandas_object(
+    pd.concat([base_subset, df_comparer[common_cols]], ignore_index=True), index=False
+).to_numpy()
+base_keys = combined_keys[:len(base_subset)]
+comparer_keys = combined_keys[len(base_subset):]
+missing_mask = ~np.isin(comparer_keys, base_keys)
+
+if not missing_mask.any():
+    # Base covers the comparer completely; skip the filter/sort work
+    full_missing = pd.DataFrame(columns=FINAL_COLUMNS)
+else:
+    full_missing = df_comparer[missing_mask]
+    # The comparison itself is order-independent; only the (small) report needs sorting
+    full_missing = full_missing.sort_values(sort_cols, ascending=True).reset_index(drop=True)
+    # Add any missing columns as blank, in the desired column order
+    for col in FINAL_COLUMNS:
+        if col not in full_missing.columns:
+            full_missing[col] = ''
+    full_missing = full_missing[FINAL_COLUMNS]
 
 # Save result
 output_file = 'Missing_Credit_Report.csv'
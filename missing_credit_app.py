@@ -1,12 +1,18 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import io
 import re
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
-from twilio.rest import Client as TwilioClient
-import base64
-import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional accelerator: a JIT-compiled antijoin beats np.isin on multi-million
+# row inputs. The app works fine without numba installed.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 st.set_page_config(page_title="Missing Credit Report Comparator", page_icon="📊", layout="wide")
 
@@ -54,62 +60,141 @@ with col2:
         comparer_file = st.file_uploader("Upload COMPARER CSV (the one to compare against)", type=["csv"], key="comparer")
         st.markdown('</div>', unsafe_allow_html=True)
 
-def clean_po(po):
-    if pd.isna(po):
-        return ''
-    return re.sub(r'\s+', '', str(po)).strip().lower()
+# Columns the app can ever use; restricting the parse to these skips
+# type inference and string allocation for everything else.
+CSV_COLUMNS = ['ACCOUNT', 'PO #', 'DESCRIPTION', 'CREDIT AMT', 'DRUG LETTER', 'DRUG NAME', 'QUARTER KEY']
+# Columns of the missing-credit report itself
+REPORT_COLUMNS = ['PO #', 'DESCRIPTION', 'CREDIT AMT', 'Missing In', 'Drug Category', 'Quarter Key']
+
+# Streamlit reruns the whole script on every widget interaction; cache the
+# heavy CSV parsing and preprocessing on the uploaded file bytes so they only
+# run when a file actually changes.
+@st.cache_data(show_spinner=False)
+def load_csv(file_bytes):
+    header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+    usecols = [c for c in CSV_COLUMNS if c in header]
+    # pyarrow engine: multi-threaded parse, Arrow-backed strings
+    return pd.read_csv(io.BytesIO(file_bytes), usecols=usecols or None, engine='pyarrow')
 
-def add_spaces(po):
-    if pd.isna(po):
-        return ''
-    po = str(po).lower()
-    po = re.sub(r"(q\d{3})(onmk)", r"\1 \2", po)
-    po = re.sub(r"(onmk|onmark)([a-z]+)", r"\1 \2", po)
-    po = re.sub(r"([a-z])(\d+%)", r"\1 \2", po)
-    return po.strip()
+# Precompiled PO normalization patterns (avoids re-resolving the pattern cache per row).
+# _SPACING_RE fuses the three old spacing rules (q323|onmk, onmk|drug, drug|pct)
+# into one alternation, so the column is scanned once instead of three times.
+# The brand rule stays a consuming alternative (like the old chain) so a second
+# brand token inside the consumed letters does not get its own space.
+_WS_RE = re.compile(r"\s+")
+_SPACING_RE = re.compile(r"(?<=q\d{3})(?=onmk)|(onmk|onmark)([a-z]+)|(?<=[a-z])(?=\d+%)")
+
+def _spacing_repl(m):
+    if m.lastindex:  # consuming brand+letters alternative
+        return m.group(1) + " " + m.group(2)
+    return " "  # zero-width boundary alternatives
 
 def extract_features(df):
-    # Clean and space PO #
-    df = df.copy()
-    df["PO #"] = df["PO #"].apply(lambda x: add_spaces(clean_po(x)))
+    # Clean and space PO # (whole-column string ops instead of a Python call per row)
+    po = (
+        df["PO #"].astype("string").str.lower()
+        .str.replace(_WS_RE, "", regex=True)
+        .str.replace(_SPACING_RE, _spacing_repl, regex=True)
+        .str.strip()
+    )
+    # assign instead of copy-then-mutate: copy-on-write keeps the caller's frame intact
+    df = df.assign(**{"PO #": po.fillna('')})
     # Remove blank PO rows
-    df = df[df["PO #"].notna() & (df["PO #"] != '')]
+    df = df[df["PO #"] != '']
     # Extract features
     df["Quarter Key"] = df["PO #"].str.extract(r"^(q\d{3})", expand=False)
     df["Drug Category"] = df["PO #"].str.extract(r"(?:onmk|onmark)\s+(.+?)\s+rbt", expand=False)
+    # Low-cardinality strings: category dtype hashes/sorts int codes instead of Python strings
+    for col in ("PO #", "Quarter Key", "Drug Category"):
+        df[col] = df[col].astype("category")
     return df
 
-def quarter_sort_key(q):
-    try:
-        return int(q[1:]) if isinstance(q, str) and len(q) > 1 else 0
-    except:
-        return 0
+def align_categories(df1, df2):
+    # Share category sets between the two frames so isin/concat stay on int codes
+    for col in ("PO #", "Quarter Key", "Drug Category"):
+        union = df1[col].cat.categories.union(df2[col].cat.categories)
+        df1[col] = df1[col].cat.set_categories(union)
+        df2[col] = df2[col].cat.set_categories(union)
+    return df1, df2
 
 def sort_df(df):
-    df = df.copy()
-    df["Quarter Sort"] = df["Quarter Key"].apply(quarter_sort_key)
-    df_sorted = df.sort_values(by=["Drug Category", "Quarter Sort"]).drop(columns=["Quarter Sort"])
+    # e.g. 'q323' -> 323; anything unparseable sorts first as 0
+    quarter_sort = pd.to_numeric(df["Quarter Key"].str[1:], errors="coerce").fillna(0).astype("int32")
+    df_sorted = (
+        df.assign(**{"Quarter Sort": quarter_sort})
+        .sort_values(by=["Drug Category", "Quarter Sort"])
+        .drop(columns=["Quarter Sort"])
+    )
     return df_sorted
 
+# Above this row count the numba antijoin pays for its compile/cast overhead
+_NUMBA_MIN_ROWS = 1_000_000
+
+if njit is not None:
+    @njit(cache=True)
+    def _antijoin_jit(own, other):
+        lookup = set(other)
+        mask = np.empty(len(own), dtype=np.bool_)
+        for i in range(len(own)):
+            mask[i] = own[i] not in lookup
+        return mask
+
+def antijoin_mask(own, other):
+    # True where own[i] does not occur in other
+    if njit is not None and max(len(own), len(other)) >= _NUMBA_MIN_ROWS:
+        return _antijoin_jit(own.astype(np.int64), other.astype(np.int64))
+    return ~np.isin(own, other)
+
 def compare_bidirectional(df1, df2):
-    # Find differences
-    missing_in_df2 = df1[~df1["PO #"].isin(df2["PO #"])]
-    missing_in_df2 = missing_in_df2.copy()
-    missing_in_df2["Missing In"] = "Comparer"
+    # Find differences; PO # categories are aligned, so the set difference runs
+    # on flat integer code arrays instead of hashing Python strings
+    codes1 = df1["PO #"].cat.codes.to_numpy()
+    codes2 = df2["PO #"].cat.codes.to_numpy()
 
-    missing_in_df1 = df2[~df2["PO #"].isin(df1["PO #"])]
-    missing_in_df1 = missing_in_df1.copy()
-    missing_in_df1["Missing In"] = "Base"
+    def diff(df, own_codes, other_codes, label):
+        return df[antijoin_mask(own_codes, other_codes)].assign(**{"Missing In": label})
 
+    # The two directions are independent and numpy releases the GIL inside
+    # isin, so they can run on two cores at once
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        f_comparer = executor.submit(diff, df1, codes1, codes2, "Comparer")
+        f_base = executor.submit(diff, df2, codes2, codes1, "Base")
+        missing_in_df2 = f_comparer.result()
+        missing_in_df1 = f_base.result()
+
+    if missing_in_df2.empty and missing_in_df1.empty:
+        # Identical PO sets; skip the concat/reindex entirely
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+
+    # Both halves share aligned categories (no upcast to object) and concat is
+    # lazy under copy-on-write, so the tagged slices are not copied again here
     final_missing = pd.concat([missing_in_df2, missing_in_df1], ignore_index=True)
-    # Keep relevant columns
-    columns_to_keep = ['PO #', 'DESCRIPTION', 'CREDIT AMT', 'Missing In', 'Drug Category', 'Quarter Key']
-    for col in columns_to_keep:
-        if col not in final_missing.columns:
-            final_missing[col] = ''
-    final_missing = final_missing[columns_to_keep]
+    # Keep relevant columns, blank-filling any that are absent, in one pass
+    final_missing = final_missing.reindex(columns=REPORT_COLUMNS, fill_value='')
     return final_missing
 
+def df_to_csv_bytes(df):
+    # Arrow writes the CSV into the buffer in one pass; to_csv(...).encode()
+    # would hold both the str and the bytes copy in memory at once.
+    buf = io.BytesIO()
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False)
+def prepare(file_bytes):
+    return extract_features(load_csv(file_bytes))
+
+@st.cache_data(show_spinner=False)
+def prepare_sorted(file_bytes):
+    # Only previews/downloads need ordering; the comparison itself does not
+    return sort_df(prepare(file_bytes))
+
+@st.cache_data(show_spinner=False)
+def run_comparison(base_bytes, comparer_bytes):
+    base_feat, comparer_feat = align_categories(prepare(base_bytes), prepare(comparer_bytes))
+    # Sort only the (small) report for display, not the full input frames
+    return sort_df(compare_bidirectional(base_feat, comparer_feat))
+
 # Initialize session state for storing comparison results
 if 'result_df' not in st.session_state:
     st.session_state.result_df = None
@@ -141,20 +226,17 @@ with col2:
 # Main logic
 if base_file and comparer_file:
     try:
-        base_df = pd.read_csv(base_file)
-        comparer_df = pd.read_csv(comparer_file)
-        # Feature extraction and cleaning
-        base_feat = extract_features(base_df)
-        comparer_feat = extract_features(comparer_df)
-        # Sorting
-        base_sorted = sort_df(base_feat)
-        comparer_sorted = sort_df(comparer_feat)
+        base_bytes = base_file.getvalue()
+        comparer_bytes = comparer_file.getvalue()
+        # Load, feature-extract and sort (cached on the file bytes)
+        base_sorted = prepare_sorted(base_bytes)
+        comparer_sorted = prepare_sorted(comparer_bytes)
         st.markdown("---")
         st.subheader(":blue[Preview: Sorted Base CSV]")
         st.dataframe(base_sorted.head(20), use_container_width=True)
         st.download_button(
             label="⬇️ Download Sorted Base CSV",
-            data=base_sorted.to_csv(index=False).encode('utf-8'),
+            data=df_to_csv_bytes(base_sorted),
             file_name="sorted_base.csv",
             mime="text/csv"
         )
@@ -162,14 +244,14 @@ if base_file and comparer_file:
         st.dataframe(comparer_sorted.head(20), use_container_width=True)
         st.download_button(
             label="⬇️ Download Sorted Comparer CSV",
-            data=comparer_sorted.to_csv(index=False).encode('utf-8'),
+            data=df_to_csv_bytes(comparer_sorted),
             file_name="sorted_comparer.csv",
             mime="text/csv"
         )
         st.markdown("---")
         if st.button("🔍 Compare and Find Missing Rows (Both Directions)", type="primary"):
             with st.spinner("Comparing files and generating report..."):
-                st.session_state.result_df = compare_bidirectional(base_sorted, comparer_sorted)
+                st.session_state.result_df = run_comparison(base_bytes, comparer_bytes)
                 st.session_state.comparison_done = True
             
             if st.session_state.result_df.empty:
@@ -179,7 +261,7 @@ if base_file and comparer_file:
                 st.dataframe(st.session_state.result_df, use_container_width=True, height=400)
                 
                 # Download button
-                csv_bytes = st.session_state.result_df.to_csv(index=False).encode('utf-8')
+                csv_bytes = df_to_csv_bytes(st.session_state.result_df)
                 st.download_button(
                     label="⬇️ Download Missing Credit Report CSV",
                     data=csv_bytes,